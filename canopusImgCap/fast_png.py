@@ -0,0 +1,152 @@
+"""
+PNG encoder specialised for 8-bit grayscale and RGB captures.
+
+Level 0 writes unfiltered rows in stored blocks. Higher levels use the
+Sub filter on every scanline, so there is no per-row filter heuristic,
+and level 1 deflates with Huffman coding only. When libdeflate is
+installed it computes the chunk CRCs and compresses every level but 1.
+"""
+import ctypes
+import struct
+import zlib
+
+import numpy as np
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# PNG colour type for each supported channel count
+COLOR_TYPES = {
+    1: 0,   # grayscale
+    3: 2,   # RGB
+}
+
+FILTER_NONE = 0
+FILTER_SUB = 1
+
+
+def load_libdeflate():
+    """Load libdeflate through ctypes, None when it is not installed"""
+    # Load by soname: find_library runs ldconfig and the compiler to search
+    try:
+        lib = ctypes.CDLL('libdeflate.so.0')
+    except OSError:
+        return None
+
+    lib.libdeflate_alloc_compressor.restype = ctypes.c_void_p
+    lib.libdeflate_alloc_compressor.argtypes = [ctypes.c_int]
+    lib.libdeflate_zlib_compress_bound.restype = ctypes.c_size_t
+    lib.libdeflate_zlib_compress_bound.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    lib.libdeflate_zlib_compress.restype = ctypes.c_size_t
+    lib.libdeflate_zlib_compress.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t,
+                                             ctypes.c_void_p, ctypes.c_size_t]
+    lib.libdeflate_crc32.restype = ctypes.c_uint32
+    lib.libdeflate_crc32.argtypes = [ctypes.c_uint32, ctypes.c_void_p, ctypes.c_size_t]
+    return lib
+
+
+LIBDEFLATE = load_libdeflate()
+
+# Idle libdeflate compressors per level. A compressor must not be used by
+# two threads at once, so each call takes one out and puts it back after.
+idle_compressors = {}
+
+
+def crc32(data, value=0):
+    """CRC-32 of data, using libdeflate's carry-less multiply code when available"""
+    if LIBDEFLATE is None:
+        return zlib.crc32(data, value)
+
+    view = np.frombuffer(data, dtype=np.uint8)
+    return LIBDEFLATE.libdeflate_crc32(value, view.ctypes.data, view.nbytes)
+
+
+def libdeflate_compress(rows, compress_level):
+    """Compress the filtered rows into a zlib stream with libdeflate
+
+    Returns None when libdeflate does not support the level (level 0
+    needs libdeflate 1.16 or later).
+    """
+    idle = idle_compressors.setdefault(compress_level, [])
+    try:
+        compressor = idle.pop()
+    except IndexError:
+        compressor = LIBDEFLATE.libdeflate_alloc_compressor(compress_level)
+        if not compressor:
+            return None
+
+    try:
+        bound = LIBDEFLATE.libdeflate_zlib_compress_bound(compressor, rows.nbytes)
+        out = np.empty(bound, dtype=np.uint8)
+        size = LIBDEFLATE.libdeflate_zlib_compress(compressor, rows.ctypes.data, rows.nbytes,
+                                                   out.ctypes.data, bound)
+    finally:
+        idle.append(compressor)
+
+    return memoryview(out)[:size]
+
+
+def chunk(chunk_type, data):
+    """Build a PNG chunk: length, type, data and CRC of type + data"""
+    crc = crc32(data, crc32(chunk_type))
+    return b''.join((struct.pack('>I', len(data)), chunk_type, data, struct.pack('>I', crc)))
+
+
+def filter_rows(pixels, channels, filter_type, scratch=None):
+    """Prefix every scanline with its filter type byte and apply the filter
+
+    The rows are built in scratch, a flat uint8 array, when it is large
+    enough; otherwise a new array is allocated.
+    """
+    height = pixels.shape[0]
+    pixels = pixels.reshape(height, -1)
+
+    shape = (height, 1 + pixels.shape[1])
+    if scratch is not None and scratch.size >= shape[0] * shape[1]:
+        rows = scratch[:shape[0] * shape[1]].reshape(shape)
+    else:
+        rows = np.empty(shape, dtype=np.uint8)
+    rows[:, 0] = filter_type
+    if filter_type == FILTER_SUB:
+        # Sub stores each byte minus the same channel of the previous
+        # pixel; uint8 arithmetic gives the modulo 256 the spec asks for
+        rows[:, 1:1 + channels] = pixels[:, :channels]
+        np.subtract(pixels[:, channels:], pixels[:, :-channels], out=rows[:, 1 + channels:])
+    else:
+        rows[:, 1:] = pixels
+
+    return rows
+
+
+def encode(image, compress_level=1, scratch=None):
+    """Encode a HxW grayscale or HxWx3 RGB uint8 array as PNG bytes
+
+    Level 0 writes stored blocks of unfiltered rows, level 1 Sub filtered
+    rows with Huffman only coding and higher levels regular deflate.
+    scratch is an optional flat uint8 array reused for the filtered rows.
+    """
+    height, width = image.shape[:2]
+    channels = image.shape[2] if image.ndim == 3 else 1
+    if image.dtype != np.uint8 or channels not in COLOR_TYPES:
+        raise ValueError(f"Unsupported image: {image.dtype} with {channels} channels")
+
+    filter_type = FILTER_NONE if compress_level == 0 else FILTER_SUB
+    rows = filter_rows(image, channels, filter_type, scratch)
+
+    # zlib's Huffman only mode beats libdeflate's fastest level on filtered
+    # camera frames, in time and in size
+    idat = None
+    if compress_level != 1 and LIBDEFLATE is not None:
+        idat = libdeflate_compress(rows, compress_level)
+
+    if idat is None:
+        strategy = zlib.Z_HUFFMAN_ONLY if compress_level == 1 else zlib.Z_DEFAULT_STRATEGY
+        compressor = zlib.compressobj(compress_level, zlib.DEFLATED, 15, 8, strategy)
+        idat = compressor.compress(rows) + compressor.flush()
+
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, COLOR_TYPES[channels], 0, 0, 0)
+    return b''.join((
+        PNG_SIGNATURE,
+        chunk(b'IHDR', ihdr),
+        chunk(b'IDAT', idat),
+        chunk(b'IEND', b''),
+    ))
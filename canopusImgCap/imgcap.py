@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 """
-Simple video capture tool using v4l2-ctl and ImageMagick convert
+Simple video capture tool using V4L2 MMAP streaming and OpenCV
 Usage: python video_capture.py <device> <size> [filename] [directory]
 """
 
@@ -8,15 +8,92 @@ import sys
 import os
 import subprocess
 import argparse
-import tempfile
 import signal
+import select
+import fcntl
+import mmap
+import shutil
+import ctypes
+import threading
+import concurrent.futures
+
+import cv2
+import numpy as np
+
+import fast_png
+import videodev2
+
+# Capture resolutions selectable with --size
+SIZE_PRESETS = {
+    'small': (640, 480),
+    'large': (1920, 1080)
+}
+
+# Number of MMAP buffers queued on the device
+N_BUFFERS = 4
+# Frames dropped after STREAMON while auto exposure settles
+WARMUP_FRAMES = 14
+# Seconds to wait for the driver to fill a buffer
+FRAME_TIMEOUT = 5
+# Damaged frames in a row skipped before a capture gives up
+MAX_BAD_FRAMES = 10
+# Largest --count accepted; a burst holds every raw frame in memory,
+# about 4 MB each at the large preset
+MAX_BURST_COUNT = 32
+# zlib level for the PNG encoder, fastest setting that still compresses
+PNG_COMPRESS_LEVEL = 1
+# zlib level used with --fast, stored blocks only
+PNG_FAST_COMPRESS_LEVEL = 0
+
+# Helper binaries resolved once, so execs skip the PATH walk. A bare name
+# is left in place when the lookup fails; check_tools() reports those.
+GST_LAUNCH = shutil.which('gst-launch-1.0') or 'gst-launch-1.0'
+WESTON_IMAGE = shutil.which('weston-image') or 'weston-image'
 
 
 class ImageCapture:
-    """_summary_
+    """Still image capture from a V4L2 device
+
+    The device keeps streaming between capture_frame calls; use the
+    instance as a context manager or call close() to release it.
     """
     def __init__(self):
         self.interrupted = False
+        self.fd = None
+        self.buffers = []
+        self.bytesperline = 0
+        self.stream_params = None
+        self.compress_level = PNG_COMPRESS_LEVEL
+        self.viewer = None
+
+        # Scratch memory reused by every single-frame capture: the RGB frame
+        # and the filtered PNG rows, sized for the largest preset. Pages are
+        # faulted in by the first capture and stay mapped for the next ones.
+        self.rgb_scratch, self.png_scratch = self.alloc_scratch()
+
+        # Burst workers run concurrently, so each thread gets its own pair
+        self.worker_scratch = threading.local()
+
+    @staticmethod
+    def alloc_scratch():
+        """Allocate RGB frame and PNG row scratch for the largest size preset"""
+        width, height = max(SIZE_PRESETS.values(), key=lambda size: size[0] * size[1])
+        rgb_scratch = np.empty(height * width * 3, dtype=np.uint8)
+        png_scratch = np.empty(height * (1 + width * 3), dtype=np.uint8)
+        return rgb_scratch, png_scratch
+
+    def thread_scratch(self):
+        """Scratch buffers of the calling thread, allocated on its first call"""
+        scratch = getattr(self.worker_scratch, 'buffers', None)
+        if scratch is None:
+            scratch = self.worker_scratch.buffers = self.alloc_scratch()
+        return scratch
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def signal_handler(self, signum, frame):
         """Handle keyboard interrupts and other signals gracefully"""
@@ -37,6 +114,12 @@ class ImageCapture:
         signal.signal(signal.SIGTERM, self.signal_handler)
 
 
+    def check_tools(self, tools):
+        """Make sure every helper binary needed for this run was found in PATH"""
+        missing = [tool for tool in tools if not os.path.isabs(tool)]
+        if missing:
+            raise RuntimeError(f"Command not found: {', '.join(missing)}. Make sure it's installed and in PATH.")
+
     def validate_device(self, device_path):
         """Validate that the video device exists and is accessible"""
         if not os.path.exists(device_path):
@@ -45,46 +128,25 @@ class ImageCapture:
         if not os.access(device_path, os.R_OK):
             raise PermissionError(f"No read permission for device {device_path}")
 
-        # Test if v4l2-ctl can access the device
-        try:
-            result = subprocess.run(
-                ['v4l2-ctl', '--device', device_path, '--list-formats'],
-                check=True,
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            if result.returncode != 0:
-                raise RuntimeError(f"Cannot access device {device_path}: {result.stderr}")
-        except subprocess.TimeoutExpired:
-            raise RuntimeError(f"Timeout while accessing device {device_path}")
-        except FileNotFoundError:
-            raise RuntimeError("v4l2-ctl not found. Please install v4l2-utils package")
-
     def get_resolution(self, size_arg):
         """Parse size argument"""
+        resolution = SIZE_PRESETS.get(size_arg.lower())
+        if resolution is not None:
+            return resolution
 
-        size_map = {
-            'small': (640,480),
-            'large': (1920,1080)
-        }
-        if size_arg.lower() in size_map:
-            return size_map[size_arg.lower()]
-
-        raise ValueError(f"Invalid size format. Use one of {list(size_map.keys())}  (e.g., 640x480)")
+        raise ValueError(f"Invalid size format. Use one of {list(SIZE_PRESETS.keys())}  (e.g., 640x480)")
 
-    def run_command(self, cmd, description="", shell_state=False):
-        """Run a shell command and handle errors"""
+    def run_command(self, cmd, description=""):
+        """Run a command and handle errors"""
         print(f"Running: {' '.join(cmd)}")
         try:
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True, shell=shell_state)
-            if result.stdout:
-                print(f"Output: {result.stdout.strip()}")
+            # Only stderr is kept, and decoded only when the command fails
+            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
             return True
         except subprocess.CalledProcessError as e:
             print(f"Error {description}: {e}")
             if e.stderr:
-                print(f"Error output: {e.stderr.strip()}")
+                print(f"Error output: {e.stderr.decode(errors='replace').strip()}")
             return False
         except FileNotFoundError:
             print(f"Command not found: {cmd[0]}. Make sure it's installed and in PATH.")
@@ -94,70 +156,289 @@ class ImageCapture:
         """Show video on the hdmi output"""
         try:
             # Step 1: Get the image
+            # gst-launch parses the pipeline from its argv, so exec it
+            # directly instead of going through a shell
             cmd1 = [
-                f'gst-launch-1.0 v4l2src device={device} '
-                f'! \'video/x-raw,width={width},height={height}\' '
-                f'! videoconvert '
-                f'! autovideosink sync=false'
+                GST_LAUNCH,
+                'v4l2src', f'device={device}',
+                '!', f'video/x-raw,width={width},height={height}',
+                '!', 'videoconvert',
+                '!', 'autovideosink', 'sync=false'
             ]
 
-            if not self.run_command(cmd1, "Geeting command", shell_state=True):
+            if not self.run_command(cmd1, "Geeting command"):
                 return False
 
             return True
         finally:
             pass
 
-    def capture_frame(self, device, width, height, output_dir, filename, show_results):
-        """Capture a frame using v4l2-ctl and convert it to PNG"""
+    def set_format(self, fd, width, height):
+        """Configure the capture format and return the line stride in bytes"""
+        fmt = videodev2.v4l2_format(type=videodev2.V4L2_BUF_TYPE_VIDEO_CAPTURE)
+        fmt.fmt.pix.width = width
+        fmt.fmt.pix.height = height
+        fmt.fmt.pix.pixelformat = videodev2.V4L2_PIX_FMT_YUYV
+        fmt.fmt.pix.field = videodev2.V4L2_FIELD_NONE
+        fcntl.ioctl(fd, videodev2.VIDIOC_S_FMT, fmt)
+
+        # The driver replaces anything it cannot do with its own choice,
+        # e.g. MJPG on a camera without YUYV at this size
+        if ((fmt.fmt.pix.width, fmt.fmt.pix.height) != (width, height)
+                or fmt.fmt.pix.pixelformat != videodev2.V4L2_PIX_FMT_YUYV
+                or fmt.fmt.pix.bytesperline < width * 2):
+            raise RuntimeError(f"Device does not support {width}x{height} YUYV capture")
+
+        return fmt.fmt.pix.bytesperline
+
+    def map_buffers(self, fd):
+        """Request MMAP buffers from the driver, map and queue each of them"""
+        req = videodev2.v4l2_requestbuffers(count=N_BUFFERS,
+                                            type=videodev2.V4L2_BUF_TYPE_VIDEO_CAPTURE,
+                                            memory=videodev2.V4L2_MEMORY_MMAP)
+        fcntl.ioctl(fd, videodev2.VIDIOC_REQBUFS, req)
+
+        buffers = []
+        for index in range(req.count):
+            buf = videodev2.v4l2_buffer(index=index,
+                                        type=videodev2.V4L2_BUF_TYPE_VIDEO_CAPTURE,
+                                        memory=videodev2.V4L2_MEMORY_MMAP)
+            fcntl.ioctl(fd, videodev2.VIDIOC_QUERYBUF, buf)
+            buffers.append(mmap.mmap(fd, buf.length, mmap.MAP_SHARED, mmap.PROT_READ,
+                                     offset=buf.m.offset))
+            fcntl.ioctl(fd, videodev2.VIDIOC_QBUF, buf)
+
+        return buffers
+
+    def dequeue_buffer(self, fd):
+        """Wait for the driver to fill a buffer and take it off the queue"""
+        readable, _, _ = select.select([fd], [], [], FRAME_TIMEOUT)
+        if not readable:
+            raise RuntimeError("Timeout while waiting for a frame")
+
+        buf = videodev2.v4l2_buffer(type=videodev2.V4L2_BUF_TYPE_VIDEO_CAPTURE,
+                                    memory=videodev2.V4L2_MEMORY_MMAP)
+        fcntl.ioctl(fd, videodev2.VIDIOC_DQBUF, buf)
+        return buf
+
+    def dequeue_frame(self, height):
+        """Dequeue the next buffer holding a complete frame, requeueing damaged ones"""
+        frame_size = self.bytesperline * height
+        for _ in range(MAX_BAD_FRAMES):
+            buf = self.dequeue_buffer(self.fd)
+            if not buf.flags & videodev2.V4L2_BUF_FLAG_ERROR and buf.bytesused >= frame_size:
+                return buf
+            # UVC drivers hand back short or corrupted frames now and then
+            fcntl.ioctl(self.fd, videodev2.VIDIOC_QBUF, buf)
+
+        raise RuntimeError(f"Got {MAX_BAD_FRAMES} damaged frames in a row")
+
+    def yuyv_to_rgb(self, frame, width, height, bytesperline, out=None):
+        """Convert a packed YUYV 4:2:2 frame to an RGB image, into out when given"""
+        raw = np.frombuffer(frame, dtype=np.uint8, count=bytesperline * height)
+        raw = raw.reshape(height, bytesperline)[:, :width * 2].reshape(height, width, 2)
+
+        # Single SIMD pass doing chroma upsampling and the BT.601 limited
+        # range matrix the camera encodes with
+        return cv2.cvtColor(raw, cv2.COLOR_YUV2RGB_YUYV, dst=out)
+
+    def drain_buffers(self):
+        """Requeue every buffer the driver has already filled, dropping stale frames"""
+        for _ in self.buffers:
+            readable, _, _ = select.select([self.fd], [], [], 0)
+            if not readable:
+                break
+            fcntl.ioctl(self.fd, videodev2.VIDIOC_QBUF, self.dequeue_buffer(self.fd))
+
+    def open_stream(self, device, width, height):
+        """Start streaming from the device with all MMAP buffers queued"""
+        self.close()
+
+        self.fd = os.open(device, os.O_RDWR)
+        try:
+            self.bytesperline = self.set_format(self.fd, width, height)
+            self.buffers = self.map_buffers(self.fd)
+
+            buf_type = videodev2.V4L2_BUF_TYPE_VIDEO_CAPTURE
+            fcntl.ioctl(self.fd, videodev2.VIDIOC_STREAMON, ctypes.c_int(buf_type))
+
+            # Drop the first frames while auto exposure settles
+            for _ in range(WARMUP_FRAMES):
+                fcntl.ioctl(self.fd, videodev2.VIDIOC_QBUF, self.dequeue_buffer(self.fd))
+        except BaseException:
+            self.close()
+            raise
+
+        self.stream_params = (device, width, height)
+
+    def close(self):
+        """Stop streaming and release the device"""
+        if self.fd is None:
+            return
+
+        try:
+            buf_type = videodev2.V4L2_BUF_TYPE_VIDEO_CAPTURE
+            fcntl.ioctl(self.fd, videodev2.VIDIOC_STREAMOFF, ctypes.c_int(buf_type))
+        except OSError:
+            pass
+
+        for buffer in self.buffers:
+            buffer.close()
+        self.buffers = []
+
+        os.close(self.fd)
+        self.fd = None
+        self.stream_params = None
+
+    def next_frame(self, device, width, height, fresh=False):
+        """Dequeue the next complete frame, starting the stream when needed"""
+        # Keep streaming between captures, only the first one pays for
+        # the device setup and the exposure warm-up
+        if self.stream_params != (device, width, height):
+            self.open_stream(device, width, height)
+
+        if fresh:
+            # Buffers filled while nobody was dequeuing hold old frames, on a
+            # new stream those the driver completed during the warm-up; wait
+            # for one exposed after this call instead
+            self.drain_buffers()
+
+        return self.dequeue_frame(height)
+
+    def grab_frame(self, device, width, height, fresh=False, out=None):
+        """Take the next frame off the V4L2 stream as an RGB image"""
+        # Convert straight out of the driver buffer, the raw frame is
+        # never copied into Python memory or through a temporary file
+        buf = self.next_frame(device, width, height, fresh)
+        try:
+            with memoryview(self.buffers[buf.index])[:self.bytesperline * height] as frame:
+                return self.yuyv_to_rgb(frame, width, height, self.bytesperline, out)
+        finally:
+            fcntl.ioctl(self.fd, videodev2.VIDIOC_QBUF, buf)
+
+    def grab_raw(self, device, width, height, fresh=False):
+        """Copy the next YUYV frame off the V4L2 stream"""
+        buf = self.next_frame(device, width, height, fresh)
+        try:
+            return self.buffers[buf.index][:self.bytesperline * height]
+        finally:
+            fcntl.ioctl(self.fd, videodev2.VIDIOC_QBUF, buf)
+
+    def save_png(self, image, final_path, scratch=None):
+        """Encode an image to PNG and write it to final_path"""
+        # Encode in memory and hand the file system a single write
+        png = fast_png.encode(image, self.compress_level, scratch)
+
+        # Stage next to the target and rename it into place, so the target
+        # never holds a partly written image
+        output_dir, filename = os.path.split(final_path)
+        stage_path = os.path.join(output_dir, f'.{filename}.tmp')
+        try:
+            with open(stage_path, 'wb') as png_file:
+                png_file.write(png)
+            os.replace(stage_path, final_path)
+        except OSError as e:
+            print(f"Error saving {final_path}: {e}")
+            try:
+                os.unlink(stage_path)
+            except OSError:
+                pass
+            return False
+
+        return True
+
+    def save_yuyv(self, frame, width, height, bytesperline, final_path, out=None, scratch=None):
+        """Convert a YUYV frame to RGB into out and save it as PNG, filtering rows in scratch"""
+        image = self.yuyv_to_rgb(frame, width, height, bytesperline, out)
+        return self.save_png(image, final_path, scratch)
+
+    def show_image(self, path):
+        """Show an image on the hdmi output without waiting for the viewer to close"""
+        # Replace the preview of the previous capture
+        if self.viewer is not None and self.viewer.poll() is None:
+            self.viewer.terminate()
+            self.viewer.wait()
+
+        cmd5 = [
+            WESTON_IMAGE,
+            path
+        ]
+        print(f"Running: {' '.join(cmd5)}")
+        try:
+            self.viewer = subprocess.Popen(cmd5, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except FileNotFoundError:
+            print(f"Command not found: {cmd5[0]}. Make sure it's installed and in PATH.")
+            self.viewer = None
+
+    def capture_frame(self, device, width, height, output_dir, filename, show_results,
+                      fresh=False):
+        """Capture a frame from the V4L2 stream and save it as PNG"""
 
         # Create output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
+        final_path = os.path.join(output_dir, filename)
+
+        rgb = self.rgb_scratch[:height * width * 3].reshape(height, width, 3)
+        try:
+            image = self.grab_frame(device, width, height, fresh, rgb)
+        except (OSError, RuntimeError) as e:
+            print(f"Error capturing from {device}: {e}")
+            self.close()
+            return False
+
+        if not self.save_png(image, final_path, self.png_scratch):
+            return False
+
+        print(f"Successfully saved image to: {final_path}")
+
+        if show_results is True:
+            self.show_image(final_path)
 
-        # Use temporary file for raw frame data
-        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
-            temp_raw_path = temp_file.name
+        return True
 
+    def capture_burst(self, device, width, height, output_dir, filename, count, show_results,
+                      fresh=False):
+        """Capture count consecutive frames and save them as numbered PNGs"""
+
+        # Create output directory if it doesn't exist
+        os.makedirs(output_dir, exist_ok=True)
+        stem, ext = os.path.splitext(filename)
+        final_paths = [os.path.join(output_dir, f'{stem}_{index:03d}{ext}')
+                       for index in range(count)]
+
+        # Grab every frame before encoding so the burst is not held back by
+        # the PNG encoder. Frames are kept as raw YUYV, two thirds the size
+        # of the converted RGB image.
         try:
-            # Step 1: Get the image
-            cmd1 = [
-                'ffmpeg','-y',
-                '-f', 'v4l2',
-                '-input_format', 'yuyv422',
-                '-video_size', f'{width}x{height}',
-                '-i', device,
-                '-vframes', '1',               
-                '-vf', 'select=gte(n\\,14)',
-                temp_raw_path
-            ]
+            frames = [self.grab_raw(device, width, height, fresh and index == 0)
+                      for index in range(count)]
+        except (OSError, RuntimeError) as e:
+            print(f"Error capturing from {device}: {e}")
+            self.close()
+            return False
 
-            if not self.run_command(cmd1, "Geeting command"):
-                return False
+        # OpenCV, NumPy and zlib release the GIL while converting and
+        # encoding, so threads keep every core busy without pickling whole
+        # frames over to worker processes
+        bytesperline = self.bytesperline
 
-            # Step 2: Moving to actual path
-            final_path = os.path.join(output_dir, filename)
-            cmd2 = ['mv', temp_raw_path, final_path]
+        def save(frame, final_path):
+            rgb_scratch, png_scratch = self.thread_scratch()
+            rgb = rgb_scratch[:height * width * 3].reshape(height, width, 3)
+            return self.save_yuyv(frame, width, height, bytesperline, final_path, rgb, png_scratch)
 
-            if not self.run_command(cmd2, f'Not able to move file {temp_raw_path} to {final_path}'):
-                return False
+        with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            results = list(executor.map(save, frames, final_paths))
 
-            print(f"Successfully saved image to: {final_path}")
+        if not all(results):
+            return False
 
-            if show_results is True:
-                cmd5 = [
-                    'weston-image',
-                    final_path
-                ]
-                self.run_command(cmd5, "showing the results on hdmi")
+        print(f"Successfully saved {count} images to: {output_dir}")
 
-            return True
+        if show_results is True:
+            self.show_image(final_paths[-1])
 
-        finally:
-            # Clean up temporary file
-            try:
-                os.unlink(temp_raw_path)
-            except OSError:
-                pass
+        return True
 
 def main():
     """Main function"""
@@ -168,7 +449,7 @@ def main():
     capture.setup_signal_handlers()
 
     parser = argparse.ArgumentParser(
-        description='Capture video frame using v4l2-ctl',
+        description='Capture video frame from a V4L2 device',
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 Size options:
@@ -179,11 +460,13 @@ Examples:
   imgcap /dev/video2 --size small
   imgcap /dev/video2 --size large --filename my_photo.png --output_dir /home/user/photos
   imgcap /dev/video3 --size large --filename custom_name.png 
+  imgcap /dev/video2 --size large --count 10 --filename burst.png
         """
     )
 
     parser.add_argument('device', help='Video device path (e.g., /dev/video2)')
-    parser.add_argument('--size',type=str, help='Image size (small/large)')
+    parser.add_argument('--size', type=str.lower, default='small', choices=list(SIZE_PRESETS),
+                        help='Image size (small/large, default: small)')
     parser.add_argument('--video',action='store_true',
                         help='streaming video through hdmi, all other options will be ignored')
     parser.add_argument('--filename', type=str, default='frame.png',
@@ -192,9 +475,15 @@ Examples:
                        help='Output directory (default: current directory)')
     parser.add_argument('--show_results', action='store_true',
                         help='Show result in hdmi output')
+    parser.add_argument('--fresh', action='store_true',
+                        help='Drop frames already queued by the driver and keep the next one')
+    parser.add_argument('--count', type=int, default=1,
+                        help=f'Number of consecutive frames to capture, at most {MAX_BURST_COUNT} (default: 1)')
+    parser.add_argument('--fast', action='store_true',
+                        help='Write uncompressed PNG, larger files but no deflate cost')
 
     # Handle case where script is called with sys.argv directly
-    if len(sys.argv) < 3:
+    if len(sys.argv) < 2:
         parser.print_help()
         sys.exit(1)
 
@@ -202,10 +491,23 @@ Examples:
 
     args = parser.parse_args()
 
+    if not 1 <= args.count <= MAX_BURST_COUNT:
+        parser.error(f'--count must be between 1 and {MAX_BURST_COUNT}')
+
     width, height = capture.get_resolution(args.size)
 
+    tools = []
+    if args.video is True:
+        tools.append(GST_LAUNCH)
+    if args.show_results is True:
+        tools.append(WESTON_IMAGE)
+    capture.check_tools(tools)
+
     capture.validate_device(args.device)
 
+    if args.fast is True:
+        capture.compress_level = PNG_FAST_COMPRESS_LEVEL
+
     # Ensure filename has .png extension
     filename = args.filename
     if not filename.lower().endswith('.png'):
@@ -216,17 +518,28 @@ Examples:
     print(f"Output: {os.path.join(args.output_dir, filename)}")
     print("-" * 50)
 
-    if args.video is True:
-        success = capture.video(args.device,
-                                width,
-                                height)
-    else:
-        success = capture.capture_frame(args.device,
-                                width,
-                                height,
-                                args.output_dir,
-                                filename,
-                                args.show_results)
+    with capture:
+        if args.video is True:
+            success = capture.video(args.device,
+                                    width,
+                                    height)
+        elif args.count > 1:
+            success = capture.capture_burst(args.device,
+                                    width,
+                                    height,
+                                    args.output_dir,
+                                    filename,
+                                    args.count,
+                                    args.show_results,
+                                    args.fresh)
+        else:
+            success = capture.capture_frame(args.device,
+                                    width,
+                                    height,
+                                    args.output_dir,
+                                    filename,
+                                    args.show_results,
+                                    args.fresh)
     if success:
         print("Capture completed successfully!")
         sys.exit(0)
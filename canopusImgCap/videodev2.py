@@ -0,0 +1,139 @@
+"""
+Minimal Video4Linux2 bindings (ctypes structs and ioctl request codes)
+used for in-process MMAP streaming capture.
+"""
+import ctypes
+
+
+def fourcc(a, b, c, d):
+    """Build a V4L2 pixel format code from its four characters"""
+    return ord(a) | (ord(b) << 8) | (ord(c) << 16) | (ord(d) << 24)
+
+
+V4L2_BUF_TYPE_VIDEO_CAPTURE = 1
+V4L2_MEMORY_MMAP = 1
+V4L2_FIELD_NONE = 1
+V4L2_BUF_FLAG_ERROR = 0x40
+V4L2_PIX_FMT_YUYV = fourcc('Y', 'U', 'Y', 'V')
+
+
+class v4l2_pix_format(ctypes.Structure):
+    """struct v4l2_pix_format"""
+    _fields_ = [
+        ('width', ctypes.c_uint32),
+        ('height', ctypes.c_uint32),
+        ('pixelformat', ctypes.c_uint32),
+        ('field', ctypes.c_uint32),
+        ('bytesperline', ctypes.c_uint32),
+        ('sizeimage', ctypes.c_uint32),
+        ('colorspace', ctypes.c_uint32),
+        ('priv', ctypes.c_uint32),
+        ('flags', ctypes.c_uint32),
+        ('ycbcr_enc', ctypes.c_uint32),
+        ('quantization', ctypes.c_uint32),
+        ('xfer_func', ctypes.c_uint32),
+    ]
+
+
+class _v4l2_format_union(ctypes.Union):
+    # The kernel union also holds struct v4l2_window, whose pointers give
+    # it native pointer alignment.
+    _fields_ = [
+        ('pix', v4l2_pix_format),
+        ('raw_data', ctypes.c_uint8 * 200),
+        ('_align', ctypes.c_void_p),
+    ]
+
+
+class v4l2_format(ctypes.Structure):
+    """struct v4l2_format"""
+    _fields_ = [
+        ('type', ctypes.c_uint32),
+        ('fmt', _v4l2_format_union),
+    ]
+
+
+class v4l2_requestbuffers(ctypes.Structure):
+    """struct v4l2_requestbuffers"""
+    _fields_ = [
+        ('count', ctypes.c_uint32),
+        ('type', ctypes.c_uint32),
+        ('memory', ctypes.c_uint32),
+        ('capabilities', ctypes.c_uint32),
+        ('flags', ctypes.c_uint8),
+        ('reserved', ctypes.c_uint8 * 3),
+    ]
+
+
+class timeval(ctypes.Structure):
+    """struct timeval"""
+    _fields_ = [
+        ('tv_sec', ctypes.c_long),
+        ('tv_usec', ctypes.c_long),
+    ]
+
+
+class v4l2_timecode(ctypes.Structure):
+    """struct v4l2_timecode"""
+    _fields_ = [
+        ('type', ctypes.c_uint32),
+        ('flags', ctypes.c_uint32),
+        ('frames', ctypes.c_uint8),
+        ('seconds', ctypes.c_uint8),
+        ('minutes', ctypes.c_uint8),
+        ('hours', ctypes.c_uint8),
+        ('userbits', ctypes.c_uint8 * 4),
+    ]
+
+
+class _v4l2_buffer_m(ctypes.Union):
+    _fields_ = [
+        ('offset', ctypes.c_uint32),
+        ('userptr', ctypes.c_ulong),
+        ('planes', ctypes.c_void_p),
+        ('fd', ctypes.c_int32),
+    ]
+
+
+class v4l2_buffer(ctypes.Structure):
+    """struct v4l2_buffer"""
+    _fields_ = [
+        ('index', ctypes.c_uint32),
+        ('type', ctypes.c_uint32),
+        ('bytesused', ctypes.c_uint32),
+        ('flags', ctypes.c_uint32),
+        ('field', ctypes.c_uint32),
+        ('timestamp', timeval),
+        ('timecode', v4l2_timecode),
+        ('sequence', ctypes.c_uint32),
+        ('memory', ctypes.c_uint32),
+        ('m', _v4l2_buffer_m),
+        ('length', ctypes.c_uint32),
+        ('reserved2', ctypes.c_uint32),
+        ('request_fd', ctypes.c_int32),
+    ]
+
+
+_IOC_WRITE = 1
+_IOC_READ = 2
+
+
+def _ioc(direction, nr, size):
+    return (direction << 30) | (size << 16) | (ord('V') << 8) | nr
+
+
+def _iow(nr, struct):
+    return _ioc(_IOC_WRITE, nr, ctypes.sizeof(struct))
+
+
+def _iowr(nr, struct):
+    return _ioc(_IOC_READ | _IOC_WRITE, nr, ctypes.sizeof(struct))
+
+
+VIDIOC_S_FMT = _iowr(5, v4l2_format)
+VIDIOC_REQBUFS = _iowr(8, v4l2_requestbuffers)
+VIDIOC_QUERYBUF = _iowr(9, v4l2_buffer)
+VIDIOC_QBUF = _iowr(15, v4l2_buffer)
+VIDIOC_DQBUF = _iowr(17, v4l2_buffer)
+VIDIOC_STREAMON = _iow(18, ctypes.c_int)
+VIDIOC_STREAMOFF = _iow(19, ctypes.c_int)
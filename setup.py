@@ -8,8 +8,9 @@ setup(
     packages=["canopusImgCap"],
     author="Aluisio Leonello Victal",
     author_email = "alvictal@gmail.com",
-    description = "v4l2-ctl and imagemagick wrapper ",
+    description = "V4L2 still image capture tool",
     license = "MIT",
-    keywords= "v4l2, imagemagick",
+    keywords= "v4l2, png",
+    install_requires=["numpy", "opencv-python-headless"],
     url = "",
 )
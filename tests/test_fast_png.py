@@ -0,0 +1,105 @@
+"""
+    Round trip tests for the fast_png encoder
+"""
+import itertools
+import struct
+import unittest
+import zlib
+from unittest import mock
+
+import cv2
+import numpy as np
+
+from canopusImgCap import fast_png
+
+LEVELS = (0, 1, 6, 9)
+SHAPES = {
+    'gray': (37, 53),
+    'rgb': (37, 53, 3),
+}
+
+
+def read_png(png):
+    """Decode a PNG written by fast_png, checking its structure along the way"""
+    assert png[:8] == fast_png.PNG_SIGNATURE, "bad signature"
+
+    chunks = []
+    offset = 8
+    while offset < len(png):
+        length, chunk_type = struct.unpack('>I4s', png[offset:offset + 8])
+        data = png[offset + 8:offset + 8 + length]
+        crc, = struct.unpack('>I', png[offset + 8 + length:offset + 12 + length])
+        assert crc == zlib.crc32(chunk_type + data), f"bad CRC in {chunk_type}"
+        chunks.append((chunk_type, data))
+        offset += 12 + length
+
+    assert [chunk_type for chunk_type, _ in chunks] == [b'IHDR', b'IDAT', b'IEND']
+    width, height, depth, color_type, compression, filter_method, interlace = \
+        struct.unpack('>IIBBBBB', chunks[0][1])
+    assert (depth, compression, filter_method, interlace) == (8, 0, 0, 0)
+    channels = {0: 1, 2: 3}[color_type]
+
+    stride = 1 + width * channels
+    rows = np.frombuffer(zlib.decompress(chunks[1][1]), dtype=np.uint8)
+    assert rows.size == height * stride, "bad IDAT size"
+    rows = rows.reshape(height, stride)
+
+    pixels = rows[:, 1:].copy()
+    for y, filter_type in enumerate(rows[:, 0]):
+        if filter_type == fast_png.FILTER_SUB:
+            for x in range(channels, pixels.shape[1]):
+                pixels[y, x] += pixels[y, x - channels]
+        else:
+            assert filter_type == fast_png.FILTER_NONE, f"unexpected filter {filter_type}"
+
+    shape = (height, width, channels) if channels == 3 else (height, width)
+    return pixels.reshape(shape)
+
+
+class FastPngRoundTrip(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # Noise on top of a gradient, so the Sub filter wraps around 0 and 255
+        self.images = {}
+        for name, shape in SHAPES.items():
+            gradient = np.linspace(0, 255, shape[1], dtype=np.uint8)[None, :]
+            if len(shape) == 3:
+                gradient = gradient[..., None]
+            noise = rng.integers(0, 256, shape, dtype=np.uint8)
+            self.images[name] = gradient + noise
+
+    def check(self, use_libdeflate):
+        libdeflate = fast_png.LIBDEFLATE if use_libdeflate else None
+        with mock.patch.object(fast_png, 'LIBDEFLATE', libdeflate):
+            for (name, image), level, use_scratch in itertools.product(
+                    self.images.items(), LEVELS, (False, True)):
+                with self.subTest(image=name, level=level, scratch=use_scratch):
+                    # Dirty scratch, larger than needed, as the capture passes it
+                    scratch = np.full(image.size * 2 + image.shape[0], 0xAA, dtype=np.uint8) \
+                        if use_scratch else None
+                    png = fast_png.encode(image, level, scratch)
+
+                    np.testing.assert_array_equal(read_png(png), image)
+
+                    decoded = cv2.imdecode(np.frombuffer(png, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+                    if image.ndim == 3:
+                        decoded = cv2.cvtColor(decoded, cv2.COLOR_BGR2RGB)
+                    np.testing.assert_array_equal(decoded, image)
+
+    def test_zlib(self):
+        self.check(use_libdeflate=False)
+
+    @unittest.skipIf(fast_png.LIBDEFLATE is None, "libdeflate is not installed")
+    def test_libdeflate(self):
+        self.check(use_libdeflate=True)
+
+    def test_rejects_unsupported_images(self):
+        with self.assertRaises(ValueError):
+            fast_png.encode(np.zeros((4, 4, 4), dtype=np.uint8))
+        with self.assertRaises(ValueError):
+            fast_png.encode(np.zeros((4, 4), dtype=np.uint16))
+
+
+if __name__ == '__main__':
+    unittest.main()